@@ -1,65 +1,306 @@
+import math
 import numpy as np 
-import matplotlib.pyplot as plt 
-from dinosim.spacecraft import DINO
+from collections import OrderedDict
+from dinosim.spacecraft import DINO, GAUSSIAN_DB_SCALE
 from dinosim.bodies import Planet
 
+# LRU cache of power received fields, keyed on everything the field depends on. 
+# See get_cached_power_received_field_from_spacecraft. 
+POWER_FIELD_CACHE_SIZE = 64
+_power_field_cache = OrderedDict()
 
-def get_power_received_field_from_spacecraft(xlim, ylim, craft, num_points=100, antenna_correction=True): 
+# The fields are only used for plotting, so single precision is plenty and halves the memory traffic. 
+FIELD_DTYPE = np.float32
+
+# Numba is optional. When it is installed the power field is computed by a fused, parallel JIT kernel, 
+# otherwise we fall back to the (vectorized) NumPy implementation. 
+try: 
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError: 
+    NUMBA_AVAILABLE = False
+    prange = range
+
+# numexpr is optional as well. It evaluates the whole (fused) power field expression in a single multithreaded pass, 
+# for setups where Numba is not available. 
+try: 
+    import numexpr
+    NUMEXPR_AVAILABLE = True
+except ImportError: 
+    NUMEXPR_AVAILABLE = False
+
+# Backends compute_power_fields can use, in order of preference when none is requested 
+POWER_FIELD_BACKENDS = ('numba', 'numexpr', 'numpy')
+
+
+# Distances are clipped to this (km * 10e3) before taking logs, so a grid point on top of a spacecraft stays finite 
+MIN_DISTANCE = 1e-9
+MIN_DISTANCE_SQ = MIN_DISTANCE ** 2
+
+
+def path_loss_frequency_term(frequency_hz): 
+    """
+        Returns the distance independent part of the free space path loss (dB), for distances in km * 10e3: 
+        FSPL = 20 * log10(d [km]) + 20 * log10(f [MHz]) + 32.44 = 20 * log10(d [km * 10e3]) + this term. 
+    """
+    return 20 * math.log10(frequency_hz / 1e6) + 32.44 + 60.0
+
+
+# Compiled copy for use inside _power_field_kernel only, the NumPy and numexpr paths call the plain function 
+_path_loss_frequency_term_jit = njit(path_loss_frequency_term) if NUMBA_AVAILABLE else path_loss_frequency_term
+
+
+def _power_field_kernel(x, y, gx, gy, freq_hz, ptx_dbm, pa, peak_gain_dB, gain_scale, antenna_correction, power_received): 
+    """
+        Computes the power received (dBm) at every point of the grid spanned by x and y in a single pass, 
+        writing it into power_received. Mirrors the NumPy implementation in get_power_received_field_from_spacecraft, 
+        with the gaussian antenna gain (see DINO.get_gain_dB_coefficients) inlined. Output is indexed [y, x], same as np.meshgrid. 
+    """
+    num_y = y.shape[0]
+    num_x = x.shape[0]
+    
+    # Terms that only depend on the spacecraft 
+    freq_term = _path_loss_frequency_term_jit(freq_hz)
+    cos_p = math.cos(pa)
+    sin_p = math.sin(pa)
+    
+    for i in prange(num_y): 
+        dy = y[i] - gy
+        for j in range(num_x): 
+            dx = x[j] - gx
+            distance_sq = max(dx * dx + dy * dy, MIN_DISTANCE_SQ)
+            power = ptx_dbm - (10 * math.log10(distance_sq) + freq_term)
+            if antenna_correction: 
+                angle_to_point = math.atan2(sin_p * dx + cos_p * dy, cos_p * dx - sin_p * dy)
+                power += peak_gain_dB - gain_scale * angle_to_point * angle_to_point
+            power_received[i, j] = power
+    
+    return power_received
+
+
+if NUMBA_AVAILABLE: 
+    _power_field_kernel = njit(parallel=True, fastmath=True, cache=True)(_power_field_kernel)
+
+
+# The power received field as a single numexpr expression, same model as _power_field_kernel. 
+# x has shape (1, N) and y (N, 1), the remaining variables are per spacecraft scalars. 
+_NUMEXPR_DX = "(x - gx)"
+_NUMEXPR_DY = "(y - gy)"
+_NUMEXPR_DISTANCE_SQ = f"({_NUMEXPR_DX}*{_NUMEXPR_DX} + {_NUMEXPR_DY}*{_NUMEXPR_DY})"
+_NUMEXPR_POWER = f"ptx - (10*log10(where({_NUMEXPR_DISTANCE_SQ} > min_d2, {_NUMEXPR_DISTANCE_SQ}, min_d2)) + fterm)"
+_NUMEXPR_ANGLE = f"arctan2(sin_p*{_NUMEXPR_DX} + cos_p*{_NUMEXPR_DY}, cos_p*{_NUMEXPR_DX} - sin_p*{_NUMEXPR_DY})"
+_NUMEXPR_POWER_CORRECTED = f"{_NUMEXPR_POWER} + gain_log - k*{_NUMEXPR_ANGLE}**2"
+
+
+def get_power_received_field_from_spacecraft(xlim, ylim, craft, num_points=100, antenna_correction=True, return_grid=True, backend=None): 
     """
         Generates a grid of points over the specified xlim and ylim that represent the power received at each point
         from a single spacecraft. Implements free space pathloss equation given frequency. 
+        Returns X, Y, power_received, or only power_received if return_grid is False. 
+        See compute_power_fields for backend. 
     """
     
-    # First generate the grid of points 
-    x = np.linspace(xlim[0], xlim[1], num_points)
-    y = np.linspace(ylim[0], ylim[1], num_points)
+    x, y = get_grid_axes(xlim, ylim, num_points)
+    power_received = compute_power_field(craft, x, y, antenna_correction=antenna_correction, backend=backend)
+    
+    if not return_grid: 
+        return power_received
     
-    # Meshgrid
     X, Y = np.meshgrid(x, y)
+    return X, Y, power_received
+
+
+def get_power_received_fields_from_spacecraft(xlim, ylim, spacecraft, num_points=100, antenna_correction=True, return_grid=True, backend=None): 
+    """
+        Batched version of get_power_received_field_from_spacecraft. Computes the power received fields of all 
+        the given spacecraft at once, returned stacked along the first axis (shape (len(spacecraft), num_points, num_points)). 
+    """
     
-    # Initialize the power received field 
-    distance_field = np.zeros_like(X)
+    x, y = get_grid_axes(xlim, ylim, num_points)
+    power_received = compute_power_fields(spacecraft, x, y, antenna_correction=antenna_correction, backend=backend)
     
-    # Then get the global position of the spacecraft in question 
-    global_x = craft.orbiting_body.x + (craft.altitude + craft.orbiting_body.radius) * np.cos(np.radians(craft.angle_global))
-    global_y = craft.orbiting_body.y + (craft.altitude + craft.orbiting_body.radius) * np.sin(np.radians(craft.angle_global))
+    if not return_grid: 
+        return power_received
     
-    # Then for each point in the field, calculate the distance
-    for i in range(num_points): 
-        for j in range(num_points): 
-            distance_field[i, j] = np.sqrt((X[i, j] - global_x) ** 2 + (Y[i, j] - global_y) ** 2)
+    X, Y = np.meshgrid(x, y)
+    return X, Y, power_received
+
+
+def get_grid_axes(xlim, ylim, num_points=100): 
+    """
+        Returns the x and y axes of the grid of points spanning xlim and ylim (the grid itself is np.meshgrid(x, y)). 
+        They can be computed once and shared by compute_power_field(s) calls over the same region. 
+    """
+    x = np.linspace(xlim[0], xlim[1], num_points, dtype=FIELD_DTYPE)
+    y = np.linspace(ylim[0], ylim[1], num_points, dtype=FIELD_DTYPE)
+    return x, y
+
+
+def compute_power_field(craft, x, y, antenna_correction=True, backend=None): 
+    """
+        Computes the power received (dBm) from a single spacecraft over the grid spanned by the axes x and y 
+        (see get_grid_axes). The field is indexed [y, x], same as np.meshgrid. See compute_power_fields for backend. 
+    """
+    return compute_power_fields([craft], x, y, antenna_correction=antenna_correction, backend=backend)[0]
+
+
+def compute_power_fields(spacecraft, x, y, antenna_correction=True, backend=None): 
+    """
+        Computes the power received (dBm) from each of the given spacecraft over the grid spanned by the axes x and y 
+        (see get_grid_axes). The fields are stacked along the first axis, shape (len(spacecraft), len(y), len(x)). 
+        backend is one of POWER_FIELD_BACKENDS. By default the first one installed is used, and a requested backend 
+        that is not installed falls back to NumPy. 
+    """
+    
+    if backend is None: 
+        backend = 'numba' if NUMBA_AVAILABLE else 'numexpr' if NUMEXPR_AVAILABLE else 'numpy'
+    elif backend not in POWER_FIELD_BACKENDS: 
+        raise ValueError(f"Unknown power field backend {backend}. Please use one of {POWER_FIELD_BACKENDS}.")
+    
+    if backend == 'numba' and NUMBA_AVAILABLE: 
+        return _compute_power_fields_numba(spacecraft, x, y, antenna_correction)
+    if backend == 'numexpr' and NUMEXPR_AVAILABLE: 
+        return _compute_power_fields_numexpr(spacecraft, x, y, antenna_correction)
+    return _compute_power_fields_numpy(spacecraft, x, y, antenna_correction)
+
+
+def _compute_power_fields_numba(spacecraft, x, y, antenna_correction): 
+    power_received = np.empty((len(spacecraft), len(y), len(x)), dtype=FIELD_DTYPE)
+    for craft, field in zip(spacecraft, power_received): 
+        global_x, global_y = craft.global_position
+        peak_gain_dB, gain_scale = craft.get_gain_dB_coefficients(degrees=False) if antenna_correction else (0.0, 0.0)
+        _power_field_kernel(x, y, global_x, global_y, 
+                            craft.frequency_hz, craft.transmit_power_dBm, 
+                            -1*craft.get_absolute_pointing_angle(degrees=False), 
+                            peak_gain_dB, gain_scale, antenna_correction, field)
+    return power_received
+
+
+def _compute_power_fields_numexpr(spacecraft, x, y, antenna_correction): 
+    power_received = np.empty((len(spacecraft), len(y), len(x)), dtype=FIELD_DTYPE)
+    expression = _NUMEXPR_POWER_CORRECTED if antenna_correction else _NUMEXPR_POWER
     
-    # Since X/Y units are in km * 10e3, multiply by 1000
-    path_loss_field = 20 * np.log10(distance_field * 1000) + 20 * np.log10(craft.frequency_hz/1e6) + 32.44
+    for craft, field in zip(spacecraft, power_received): 
+        global_x, global_y = craft.global_position
+        pointing_angle = -1*craft.get_absolute_pointing_angle(degrees=False)
+        
+        # Scalars are passed as FIELD_DTYPE, so the expression is evaluated in single precision 
+        variables = dict(x=x.reshape(1, -1), y=y.reshape(-1, 1), 
+                         gx=FIELD_DTYPE(global_x), gy=FIELD_DTYPE(global_y), 
+                         ptx=FIELD_DTYPE(craft.transmit_power_dBm), 
+                         fterm=FIELD_DTYPE(path_loss_frequency_term(craft.frequency_hz)), 
+                         min_d2=FIELD_DTYPE(MIN_DISTANCE_SQ))
+        if antenna_correction: 
+            peak_gain_dB, gain_scale = craft.get_gain_dB_coefficients(degrees=False)
+            variables.update(cos_p=FIELD_DTYPE(math.cos(pointing_angle)), sin_p=FIELD_DTYPE(math.sin(pointing_angle)), 
+                             gain_log=FIELD_DTYPE(peak_gain_dB), k=FIELD_DTYPE(gain_scale))
+        
+        numexpr.evaluate(expression, local_dict=variables, out=field, casting='same_kind')
+    
+    return power_received
+
+
+def _compute_power_fields_numpy(spacecraft, x, y, antenna_correction): 
+    # Gather the per spacecraft parameters into arrays of shape (S, 1, 1), so they broadcast against the grid. 
+    # They are cast to FIELD_DTYPE, otherwise NumPy would promote the whole field back to float64 
+    def per_craft(values): 
+        return np.array(values, dtype=FIELD_DTYPE).reshape(-1, 1, 1)
+    
+    global_x = per_craft([craft.global_position[0] for craft in spacecraft])
+    global_y = per_craft([craft.global_position[1] for craft in spacecraft])
+    
+    # Then for each point in the field, calculate the distance from each spacecraft. 
+    # dx only varies along x (shape (S, 1, N)) and dy along y (shape (S, N, 1)), so no meshgrid is needed. 
+    dx = x.reshape(1, 1, -1) - global_x
+    dy = y.reshape(1, -1, 1) - global_y
+    # 20 * log10(d) == 10 * log10(d^2), so the path loss only needs the squared distance (no sqrt)
+    distance_sq_field = dx * dx + dy * dy
+    np.maximum(distance_sq_field, MIN_DISTANCE_SQ, out=distance_sq_field)
+    
+    # The distance unit conversion (X/Y units are in km * 10e3) is folded into the per spacecraft frequency term 
+    path_loss_field = 10 * np.log10(distance_sq_field) + per_craft([path_loss_frequency_term(craft.frequency_hz) for craft in spacecraft])
     
     # Calculate the power recieved at each point (without antenna correction)
-    power_received = craft.transmit_power_dBm - path_loss_field
+    power_received = per_craft([craft.transmit_power_dBm for craft in spacecraft]) - path_loss_field
+    
+    # Without antenna correction we are done, skip the rotation and arctan2 entirely
+    if not antenna_correction: 
+        return power_received
     
     # Finally, apply the antenna gain correction. To do this, for a given point, calculate the angle between the
     # spacecraft's pointing direction and the vector from the spacecraft to the point.
     # Then, calculate the gain at that angle and apply it to the received power.
-    if antenna_correction: 
-        for i in range(num_points): 
-            for j in range(num_points): 
-                # Calculate the angle between the pointing direction and the vector from the spacecraft to the point
-                pointing_angle = -1*craft.get_absolute_pointing_angle(degrees=False)
-                vector_to_point = np.array([X[i, j] - global_x, Y[i, j] - global_y])
-                rotation_matrix = np.array([[np.cos(pointing_angle), -np.sin(pointing_angle)], [np.sin(pointing_angle), np.cos(pointing_angle)]])
-                vector_to_point_in_new_frame = np.dot(rotation_matrix, vector_to_point)
-                angle_to_point = np.arctan2(vector_to_point_in_new_frame[1], vector_to_point_in_new_frame[0])
-                
-                # Calculate the angle between the two vectors
-                angle_diff = angle_to_point
-                
-                # Calculate the gain at that angle
-                gain_at_angle = craft.get_absolute_gain_dB(angle_diff, degrees=False) 
-                
-                # Apply the gain to the received power
-                power_received[i, j] += gain_at_angle
-                
-                # if i % 50 == 0 and j % 50 == 0:
-                #     print(f"Spacecraft absolute angle is {craft.get_absolute_pointing_angle(degrees=True)} degrees.")
-                #     print(f"For point ({X[i, j]}, {Y[i, j]}), angle to point is {np.degrees(angle_to_point)} and angle diff is {np.degrees(angle_diff)}.")
-                #     print(f"Gain at angle is {gain_at_angle} dB.")
-    
-    return X, Y, power_received
\ No newline at end of file
+    
+    # Rotate every vector from the spacecraft to a grid point into the spacecraft's pointing frame
+    pointing_angle = -1*np.array([craft.get_absolute_pointing_angle(degrees=False) for craft in spacecraft])
+    cos_p = per_craft(np.cos(pointing_angle))
+    sin_p = per_craft(np.sin(pointing_angle))
+    vx = cos_p * dx - sin_p * dy
+    vy = sin_p * dx + cos_p * dy
+    angle_to_point = np.arctan2(vy, vx)
+    
+    # Gaussian antenna gain in dB (see DINO.get_absolute_gain_dB), evaluated for all spacecraft at once
+    gain_coefficients = [craft.get_gain_dB_coefficients(degrees=False) for craft in spacecraft]
+    gain_log_dB = per_craft([peak_gain_dB for peak_gain_dB, _ in gain_coefficients])
+    gain_scale = per_craft([gain_scale for _, gain_scale in gain_coefficients])
+    angle_to_point *= angle_to_point
+    angle_to_point *= gain_scale
+    power_received += gain_log_dB
+    power_received -= angle_to_point
+    
+    return power_received
+
+
+def _power_field_cache_key(xlim, ylim, craft, num_points, antenna_correction): 
+    return (id(craft), tuple(xlim), tuple(ylim), num_points, antenna_correction, 
+            craft.orbiting_body.x, craft.orbiting_body.y, craft.orbiting_body.radius, craft.altitude, 
+            craft.angle_global, craft.pointing_angle, 
+            craft.transmit_power_dBm, craft.frequency_hz, craft.antenna_gain_dB)
+
+
+def get_cached_power_received_field_from_spacecraft(xlim, ylim, craft, num_points=100, antenna_correction=True): 
+    """
+        Memoized version of get_power_received_field_from_spacecraft. Repeated calls for a spacecraft whose 
+        position, pointing and comm params have not changed (over the same grid) return the previously computed field. 
+        Only the power received field is returned (and kept), the X/Y grid is not. 
+        The returned array is shared between callers and is therefore read-only. 
+    """
+    
+    return get_cached_power_received_fields_from_spacecraft(xlim, ylim, [craft], num_points=num_points, antenna_correction=antenna_correction)[0]
+
+
+def get_cached_power_received_fields_from_spacecraft(xlim, ylim, spacecraft, num_points=100, antenna_correction=True): 
+    """
+        Memoized version of get_power_received_fields_from_spacecraft. Returns a list with the (read-only) power 
+        received field of each spacecraft. Fields that are not cached yet are computed together in a single batch. 
+    """
+    
+    keys = [_power_field_cache_key(xlim, ylim, craft, num_points, antenna_correction) for craft in spacecraft]
+    fields = [None] * len(spacecraft)
+    missing = []
+    
+    for i, key in enumerate(keys): 
+        if key in _power_field_cache: 
+            _power_field_cache.move_to_end(key)
+            fields[i] = _power_field_cache[key]
+        else: 
+            missing.append(i)
+    
+    if missing: 
+        power_received = get_power_received_fields_from_spacecraft(xlim, ylim, [spacecraft[i] for i in missing], num_points=num_points, antenna_correction=antenna_correction, return_grid=False)
+        power_received.setflags(write=False)
+        
+        for i, field in zip(missing, power_received): 
+            fields[i] = field
+            _power_field_cache[keys[i]] = field
+            if len(_power_field_cache) > POWER_FIELD_CACHE_SIZE: 
+                _power_field_cache.popitem(last=False)
+    
+    return fields
+
+
+def clear_power_field_cache(): 
+    """
+        Drops all fields memoized by get_cached_power_received_field(s)_from_spacecraft. 
+    """
+    _power_field_cache.clear()
\ No newline at end of file
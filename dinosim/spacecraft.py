@@ -1,5 +1,8 @@
+import math
 import numpy as np 
-import matplotlib.pyplot as plt
+
+# 10 * log10(exp(-x)) == -GAUSSIAN_DB_SCALE * x, used to evaluate the gaussian pattern directly in dB 
+GAUSSIAN_DB_SCALE = 10.0 / np.log(10.0)
 
 class DINO: 
     def __init__(self, 
@@ -23,11 +26,22 @@ class DINO:
         self.pointing_angle = pointing_angle
         self.comms_params_set = False
         
+    @property
+    def global_position(self): 
+        """
+            Global (x, y) position of the spacecraft, computed from its orbiting body, altitude and global angle. 
+        """
+        orbit_radius = self.altitude + self.orbiting_body.radius
+        # Scalar math, the numpy ufuncs would wrap every intermediate in a numpy scalar 
+        angle = math.radians(self.angle_global)
+        return (self.orbiting_body.x + orbit_radius * math.cos(angle), 
+                self.orbiting_body.y + orbit_radius * math.sin(angle))
+        
     def get_absolute_pointing_angle(self, degrees=True): 
         if degrees: 
             return self.angle_global + self.pointing_angle
         else: 
-            return np.radians(self.angle_global + self.pointing_angle)
+            return math.radians(self.angle_global + self.pointing_angle)
         
     def set_comm_params(self, transmit_power_dBm, frequency_hz, antenna_gain_dB): 
         self.transmit_power_dBm = transmit_power_dBm
@@ -36,11 +50,14 @@ class DINO:
         self.antenna_gain_abs = 10 ** (antenna_gain_dB / 10)
         self.comms_params_set = True
         
-    def get_absolute_radiation_pattern(self, degrees=True): 
+    @property
+    def antenna_gain_dB(self): 
+        return self._antenna_gain_dB
+        
+    @antenna_gain_dB.setter
+    def antenna_gain_dB(self, antenna_gain_dB): 
+        self._antenna_gain_dB = antenna_gain_dB
         
-        if not self.comms_params_set: 
-            raise ValueError("Communication parameters not set. Please call set_comm_params() first.")
-            
         # Uses a simplified radiation pattern model. Under the assumption that a patch antenna 
         # with a gain of 3dB will have a half-power beamwidth of 65 degrees. 
         # These values are hardcoded, as they define the shape of the radiation pattern.
@@ -49,13 +66,34 @@ class DINO:
         gain_3dB = 3    
         K = beamwidth_3dB * np.sqrt(gain_3dB)
             
-        # Calculate gaussian parameters for satellite's specific architecture
-        antenna_beamwidth = K / np.sqrt(self.antenna_gain_dB)
-        sigma = np.radians(antenna_beamwidth) / 2
+        # Calculate gaussian parameters for satellite's specific architecture. 
+        # These are cached whenever the gain is set, as every gain/radiation pattern getter needs them. 
+        antenna_beamwidth = K / np.sqrt(antenna_gain_dB)
+        self._sigma = np.radians(antenna_beamwidth) / 2
+        self._inv_two_sigma_sq = 0.5 / self._sigma ** 2
+        self._inv_two_sigma_sq_deg = 0.5 / np.degrees(self._sigma) ** 2
+        
+        # Peak gain in dB, so get_absolute_gain_dB avoids an exp/log10 round trip
+        self._gain_log_dB = 10 * np.log10(antenna_gain_dB)
+        
+    def get_beam_sigma(self): 
+        """
+            Returns the standard deviation (radians) of the gaussian used to model the radiation pattern. 
+        """
+        if not self.comms_params_set: 
+            raise ValueError("Communication parameters not set. Please call set_comm_params() first.")
+        
+        return self._sigma
+        
+    def get_absolute_radiation_pattern(self, degrees=True): 
+        
+        if not self.comms_params_set: 
+            raise ValueError("Communication parameters not set. Please call set_comm_params() first.")
+            
         theta = np.linspace(-np.pi, np.pi, 360)
         
         # Get gains for all these values of theta. 
-        pattern = self.antenna_gain_dB * np.exp(-0.5 * (theta / sigma) ** 2)
+        pattern = self.get_absolute_gain(theta, degrees=False)
         
         if degrees: 
             theta = np.degrees(theta) # Return theta in radians
@@ -63,8 +101,19 @@ class DINO:
         return theta, pattern
     
     def get_absolute_radiation_pattern_dB(self, degrees=True): 
-        theta, pattern = self.get_absolute_radiation_pattern(degrees=degrees)
-        return theta, 10 * np.log10(pattern)
+        
+        if not self.comms_params_set: 
+            raise ValueError("Communication parameters not set. Please call set_comm_params() first.")
+            
+        theta = np.linspace(-np.pi, np.pi, 360)
+        
+        # Get gains (dB) for all these values of theta. 
+        pattern_dB = self.get_absolute_gain_dB(theta, degrees=False)
+        
+        if degrees: 
+            theta = np.degrees(theta)
+        
+        return theta, pattern_dB
     
     def get_normalized_radiation_pattern(self, degrees=True):
         theta, pattern = self.get_absolute_radiation_pattern(degrees=degrees)
@@ -75,6 +124,7 @@ class DINO:
         return theta, pattern_dB - np.max(pattern_dB)
     
     def plot_absolute_radiation_pattern(self):
+        import matplotlib.pyplot as plt # Imported lazily, so headless simulations do not load matplotlib
         theta, pattern = self.get_absolute_radiation_pattern() # No radians option available.
         plt.figure()
         ax = plt.subplot(111, polar=True)
@@ -84,6 +134,7 @@ class DINO:
         ax.grid(True)
         
     def plot_absolute_radiation_pattern_dB(self):
+        import matplotlib.pyplot as plt
         theta, pattern_dB = self.get_absolute_radiation_pattern_dB() # No radians option available.
         plt.figure()
         ax = plt.subplot(111, polar=True)
@@ -92,28 +143,57 @@ class DINO:
         ax.set_ylim(-40, self.antenna_gain_dB + 5)
         ax.grid(True)
     
-    def get_absolute_gain(self, theta, degrees=True): 
+    def get_absolute_gain(self, theta, degrees=True, out=None): 
+        """
+            Returns the (linear) antenna gain at angle theta from the pointing direction. 
+            theta may be a scalar or an ndarray, in which case the gain is evaluated elementwise 
+            (with the same floating point dtype). If out is given, the result is written into it. 
+        """
         if not self.comms_params_set: 
             raise ValueError("Communication parameters not set. Please call set_comm_params() first.")
         
-        # Uses a simplified radiation pattern model. Under the assumption that a patch antenna 
-        # with a gain of 3dB will have a half-power beamwidth of 65 degrees. 
-        # These values are hardcoded, as they define the shape of the radiation pattern.
-        # As it changes with gain value. 
-        beamwidth_3dB = 65
-        gain_3dB = 3    
-        K = beamwidth_3dB * np.sqrt(gain_3dB)
-            
-        # Calculate gaussian parameters for satellite's specific architecture
-        antenna_beamwidth = K / np.sqrt(self.antenna_gain_dB)
-        sigma = np.radians(antenna_beamwidth) / 2
+        # Rather than converting theta, use sigma in the units theta is passed in 
+        inv_two_sigma_sq = self._inv_two_sigma_sq_deg if degrees else self._inv_two_sigma_sq
         
-        if degrees: 
-            theta = np.radians(theta) # Theta is passed in as degrees 
+        gain = np.multiply(theta, theta, out=out, dtype=self._angle_dtype(theta))
+        gain *= -inv_two_sigma_sq
+        gain = np.exp(gain, out=gain) if isinstance(gain, np.ndarray) else np.exp(gain)
+        gain *= self.antenna_gain_dB
         
-        return self.antenna_gain_dB * np.exp(-0.5 * (theta / sigma) ** 2)
+        return gain
     
-    def get_absolute_gain_dB(self, theta, degrees=True): 
-        absolute_gain = self.get_absolute_gain(theta, degrees=degrees)
-
-        return 10 * np.log10(absolute_gain)
\ No newline at end of file
+    def get_absolute_gain_dB(self, theta, degrees=True, out=None): 
+        """
+            Returns the antenna gain (dB) at angle theta from the pointing direction. 
+            Same as 10 * log10(get_absolute_gain(theta)), but evaluated without exp and log10. 
+            theta may be a scalar or an ndarray. If out is given, the result is written into it. 
+        """
+        if not self.comms_params_set: 
+            raise ValueError("Communication parameters not set. Please call set_comm_params() first.")
+        
+        # Rather than converting theta, use coefficients in the units theta is passed in 
+        peak_gain_dB, gain_scale = self.get_gain_dB_coefficients(degrees=degrees)
+        
+        gain_dB = np.multiply(theta, theta, out=out, dtype=self._angle_dtype(theta))
+        gain_dB *= -gain_scale
+        gain_dB += peak_gain_dB
+        
+        return gain_dB
+    
+    def get_gain_dB_coefficients(self, degrees=False): 
+        """
+            Returns (peak_gain_dB, gain_scale), such that the antenna gain (dB) at angle theta from the pointing 
+            direction is peak_gain_dB - gain_scale * theta ** 2 (theta in degrees or radians). 
+            All implementations of the gaussian antenna model should read their coefficients from here. 
+        """
+        if not self.comms_params_set: 
+            raise ValueError("Communication parameters not set. Please call set_comm_params() first.")
+        
+        inv_two_sigma_sq = self._inv_two_sigma_sq_deg if degrees else self._inv_two_sigma_sq
+        return self._gain_log_dB, GAUSSIAN_DB_SCALE * inv_two_sigma_sq
+    
+    @staticmethod
+    def _angle_dtype(theta): 
+        # Keep floating point angles in their own precision, integer angles are promoted to float64 
+        dtype = np.asarray(theta).dtype
+        return dtype if np.issubdtype(dtype, np.floating) else np.float64
@@ -1,9 +1,57 @@
 import numpy as np 
-import matplotlib.pyplot as plt 
 from dinosim.spacecraft import DINO
 from dinosim.bodies import Planet
-from dinosim.comms import get_power_received_field_from_spacecraft
+from dinosim.comms import get_cached_power_received_field_from_spacecraft, get_cached_power_received_fields_from_spacecraft
 
+def get_field_extent(xlim, ylim, field): 
+    """
+        Returns the imshow extent of a field sampled on a regular grid spanning xlim and ylim (inclusive), 
+        so that each pixel is centered on its grid point (same as pcolormesh with shading='auto'). 
+    """
+    num_y, num_x = field.shape
+    half_dx = (xlim[1] - xlim[0]) / (num_x - 1) / 2
+    half_dy = (ylim[1] - ylim[0]) / (num_y - 1) / 2
+    return [xlim[0] - half_dx, xlim[1] + half_dx, ylim[0] - half_dy, ylim[1] + half_dy]
+
+
+def plot_planets(ax, planets, circle_color=None, text_color=None): 
+    """
+        Draws the planets as circles on ax, labelled with their names. 
+        text_color is either a color, or a function of the planet returning its label color. 
+    """
+    import matplotlib.pyplot as plt
+    
+    for planet in planets: 
+        planet_radius_text_offset = -1 * planet.radius - 15 if planet.radius < 20 else 0
+        circle = plt.Circle((planet.x, planet.y), planet.radius, alpha=0.5, color=circle_color)
+        ax.add_patch(circle)
+        planet_text_color = text_color(planet) if callable(text_color) else text_color
+        ax.text(planet.x, planet.y + planet_radius_text_offset, planet.name, fontsize=12, ha='center', va='center', color=planet_text_color)
+        
+        
+def plot_spacecraft(ax, spacecraft, colors='r'): 
+    """
+        Draws each spacecraft at its global position on ax, with an arrow in the direction it is pointing. 
+        colors is either a single color for all spacecraft, or a list with one color per spacecraft. 
+    """
+    
+    if isinstance(colors, str): 
+        colors = [colors] * len(spacecraft)
+    
+    # Spacecraft plot parameters 
+    direction_vector_length = 40
+    
+    global_x = np.array([craft.global_position[0] for craft in spacecraft])
+    global_y = np.array([craft.global_position[1] for craft in spacecraft])
+    pointing_angles = np.array([craft.get_absolute_pointing_angle(degrees=False) for craft in spacecraft])
+    
+    # Plot all the spacecraft, and their direction vectors, as a single artist each
+    ax.scatter(global_x, global_y, c=colors, zorder=2)
+    ax.quiver(global_x, global_y, 
+              direction_vector_length * np.cos(pointing_angles), direction_vector_length * np.sin(pointing_angles), 
+              angles='xy', scale_units='xy', scale=1, width=0.004)
+    
+    
 def plot_planets_and_spacecraft(planets, spacecraft): 
     """
         Plots the planets and spacecraft in 2D. 
@@ -14,37 +62,16 @@ def plot_planets_and_spacecraft(planets, spacecraft):
         to its orbiting body (effectively the x-axis). 
         Pointing angles define the direction the spacecraft is pointing in (relative frame). 
     """  
+    import matplotlib.pyplot as plt
     
     fig, ax = plt.subplots()
     
-    for planet in planets: 
-        planet_radius_text_offset = -1 * planet.radius - 15 if planet.radius < 20 else 0
-        circle = plt.Circle((planet.x, planet.y), planet.radius, alpha=0.5)
-        ax.add_patch(circle)
-        plt.text(planet.x, planet.y + planet_radius_text_offset, planet.name, fontsize=12, ha='center', va='center')
+    plot_planets(ax, planets)
         
     ax.set_xlim([-100, 500]) 
     ax.set_ylim([-300, 300]) 
         
-    # Spacecraft plot parameters 
-    direction_vector_length = 40
-    
-    for craft in spacecraft: 
-        
-        # print(f"Spacecraft {craft.name} is at altitude {craft.altitude} KM, orbiting {craft.orbiting_body.name}.")
-        # print(f"With global angle {craft.angle_global} degrees and pointing angle {craft.pointing_angle} degrees.")
-        # print(f"Orbiting body: {craft.orbiting_body}")
-        
-        global_x = craft.orbiting_body.x + (craft.altitude + craft.orbiting_body.radius) * np.cos(np.radians(craft.angle_global))
-        global_y = craft.orbiting_body.y + (craft.altitude + craft.orbiting_body.radius) * np.sin(np.radians(craft.angle_global))
-        
-        # Plot the spacecraft
-        plt.plot(global_x, global_y, 'ro')
-        
-        # Plot the direction vector
-        direction_x = global_x + direction_vector_length * np.cos(craft.get_absolute_pointing_angle(degrees=False))
-        direction_y = global_y + direction_vector_length * np.sin(craft.get_absolute_pointing_angle(degrees=False))
-        ax.annotate("", xy=(direction_x, direction_y), xytext=(global_x, global_y), arrowprops=dict(arrowstyle="->"))
+    plot_spacecraft(ax, spacecraft)
         
         
     # ax.set_aspect('equal', adjustable='datalim')
@@ -61,49 +88,25 @@ def plot_received_power_field(planets, spacecraft, spacecraft_index=0, antenna_c
        This spacecraft is defined with spacecraft_index. 
        The received power is the power received by any spacecraft at any given point.
     """  
+    import matplotlib.pyplot as plt
     
     fig, ax = plt.subplots()
     xlim = [-100, 500]
     ylim = [-300, 300]
     
     # First, get the power recieved field and add it to the plot 
-    X, Y, power_received = get_power_received_field_from_spacecraft(xlim, ylim, spacecraft[spacecraft_index], antenna_correction=antenna_correction)
+    power_received = get_cached_power_received_field_from_spacecraft(xlim, ylim, spacecraft[spacecraft_index], antenna_correction=antenna_correction)
     
-    # Then, plot the power recieved field using pcolormesh 
-    c = ax.pcolormesh(X, Y, power_received, cmap='plasma', shading='auto')
+    # Then, plot the power recieved field as an image (the grid is regular)
+    c = ax.imshow(power_received, extent=get_field_extent(xlim, ylim, power_received), origin='lower', cmap='plasma', aspect='auto', interpolation='nearest')
     fig.colorbar(c, ax=ax, label='Power Received (dBm)')
     
-    for planet in planets: 
-        planet_radius_text_offset = -1 * planet.radius - 15 if planet.radius < 20 else 0
-        circle = plt.Circle((planet.x, planet.y), planet.radius, alpha=0.5, color='grey')
-        ax.add_patch(circle)
-        plt.text(planet.x, planet.y + planet_radius_text_offset, planet.name, fontsize=12, ha='center', va='center', color='white')
+    plot_planets(ax, planets, circle_color='grey', text_color='white')
         
     ax.set_xlim(xlim) 
     ax.set_ylim(ylim) 
         
-    # Spacecraft plot parameters 
-    direction_vector_length = 40
-    
-    for craft in spacecraft: 
-        
-        # print(f"Spacecraft {craft.name} is at altitude {craft.altitude} KM, orbiting {craft.orbiting_body.name}.")
-        # print(f"With global angle {craft.angle_global} degrees and pointing angle {craft.pointing_angle} degrees.")
-        # print(f"Orbiting body: {craft.orbiting_body}")
-        
-        global_x = craft.orbiting_body.x + (craft.altitude + craft.orbiting_body.radius) * np.cos(np.radians(craft.angle_global))
-        global_y = craft.orbiting_body.y + (craft.altitude + craft.orbiting_body.radius) * np.sin(np.radians(craft.angle_global))
-        
-        # Plot the spacecraft
-        if craft == spacecraft[spacecraft_index]: 
-            plt.plot(global_x, global_y, 'go')
-        else: 
-            plt.plot(global_x, global_y, 'ro')
-        
-        # Plot the direction vector
-        direction_x = global_x + direction_vector_length * np.cos(craft.get_absolute_pointing_angle(degrees=False))
-        direction_y = global_y + direction_vector_length * np.sin(craft.get_absolute_pointing_angle(degrees=False))
-        ax.annotate("", xy=(direction_x, direction_y), xytext=(global_x, global_y), arrowprops=dict(arrowstyle="->"))
+    plot_spacecraft(ax, spacecraft, colors=['g' if craft == spacecraft[spacecraft_index] else 'r' for craft in spacecraft])
         
         
     # ax.set_aspect('equal', adjustable='datalim')
@@ -119,52 +122,31 @@ def plot_best_received_power_field(planets, spacecraft, antenna_correction=True)
        Plots the best recieved power at any given point in the map given the reception of all spacecraft. 
        The best received power is the highest power received by any spacecraft at any given point.
     """  
+    import matplotlib.pyplot as plt
     
     fig, ax = plt.subplots()
     xlim = [-100, 500]
     ylim = [-300, 300]
     
     # First, get the power recieved field and add it to the plot 
-    power_maps = []
+    # The fields of all spacecraft are computed in one batch, the best power is then reduced as we go
+    best_power_map = None
     
-    for craft in spacecraft: 
-        X, Y, power_received = get_power_received_field_from_spacecraft(xlim, ylim, craft, antenna_correction=antenna_correction)
-        power_maps.append(power_received)
-        
-    best_power_map = np.max(np.array(power_maps), axis=0)
+    for power_received in get_cached_power_received_fields_from_spacecraft(xlim, ylim, spacecraft, antenna_correction=antenna_correction): 
+        if best_power_map is None: 
+            best_power_map = np.full(power_received.shape, -np.inf, dtype=power_received.dtype)
+        np.maximum(best_power_map, power_received, out=best_power_map)
     
-    # Then, plot the power recieved field using pcolormesh 
-    c = ax.pcolormesh(X, Y, best_power_map, cmap='plasma', shading='auto')
+    # Then, plot the power recieved field as an image (the grid is regular)
+    c = ax.imshow(best_power_map, extent=get_field_extent(xlim, ylim, best_power_map), origin='lower', cmap='plasma', aspect='auto', interpolation='nearest')
     fig.colorbar(c, ax=ax, label='Power Received (dBm)')
 
-    for planet in planets: 
-        planet_radius_text_offset = -1 * planet.radius - 15 if planet.radius < 20 else 0
-        circle = plt.Circle((planet.x, planet.y), planet.radius, alpha=0.5, color='grey')
-        ax.add_patch(circle)
-        plt.text(planet.x, planet.y + planet_radius_text_offset, planet.name, fontsize=12, ha='center', va='center', color='white')
+    plot_planets(ax, planets, circle_color='grey', text_color='white')
         
     ax.set_xlim(xlim) 
     ax.set_ylim(ylim) 
         
-    # Spacecraft plot parameters 
-    direction_vector_length = 40
-    
-    for craft in spacecraft: 
-        
-        # print(f"Spacecraft {craft.name} is at altitude {craft.altitude} KM, orbiting {craft.orbiting_body.name}.")
-        # print(f"With global angle {craft.angle_global} degrees and pointing angle {craft.pointing_angle} degrees.")
-        # print(f"Orbiting body: {craft.orbiting_body}")
-        
-        global_x = craft.orbiting_body.x + (craft.altitude + craft.orbiting_body.radius) * np.cos(np.radians(craft.angle_global))
-        global_y = craft.orbiting_body.y + (craft.altitude + craft.orbiting_body.radius) * np.sin(np.radians(craft.angle_global))
-        
-        # Plot the spacecraft
-        plt.plot(global_x, global_y, 'ro')
-        
-        # Plot the direction vector
-        direction_x = global_x + direction_vector_length * np.cos(craft.get_absolute_pointing_angle(degrees=False))
-        direction_y = global_y + direction_vector_length * np.sin(craft.get_absolute_pointing_angle(degrees=False))
-        ax.annotate("", xy=(direction_x, direction_y), xytext=(global_x, global_y), arrowprops=dict(arrowstyle="->"))
+    plot_spacecraft(ax, spacecraft)
         
         
     # ax.set_aspect('equal', adjustable='datalim')
@@ -180,55 +162,32 @@ def plot_min_satellite_acquisition(planets, spacecraft, min_power=-135, antenna_
        Plots the minimum number of satellites satisfying the minimum power requirement at any given point in the map. 
        The minimum power requirement is defined by min_power.
     """  
+    import matplotlib.pyplot as plt
     
     fig, ax = plt.subplots()
     xlim = [-100, 500]
     ylim = [-300, 300]
     
     # First, get the power recieved field and add it to the plot 
-    power_maps = []
+    # The fields of all spacecraft are computed in one batch. For each point, count the number of power maps 
+    # that satisfy the min_power requirement as we go
+    num_satellites = None
     
-    for craft in spacecraft: 
-        X, Y, power_received = get_power_received_field_from_spacecraft(xlim, ylim, craft, antenna_correction=antenna_correction)
-        power_maps.append(power_received)
-        
-    power_maps = np.array(power_maps)
-    
-    # now for each point, count the number of power maps that satisfy the min_power requirement
-    num_satellites = np.sum(power_maps >= min_power, axis=0)
+    for power_received in get_cached_power_received_fields_from_spacecraft(xlim, ylim, spacecraft, antenna_correction=antenna_correction): 
+        if num_satellites is None: 
+            num_satellites = np.zeros(power_received.shape, dtype=np.int16)
+        num_satellites += power_received >= min_power
     
-    # Then, plot the power recieved field using pcolormesh 
-    c = ax.pcolormesh(X, Y, num_satellites, cmap='plasma', shading='auto')
+    # Then, plot the power recieved field as an image (the grid is regular)
+    c = ax.imshow(num_satellites, extent=get_field_extent(xlim, ylim, num_satellites), origin='lower', cmap='plasma', aspect='auto', interpolation='nearest')
     fig.colorbar(c, ax=ax, label='Number of Satellites Acquired')
 
-    for planet in planets: 
-        planet_radius_text_offset = -1 * planet.radius - 15 if planet.radius < 20 else 0
-        circle = plt.Circle((planet.x, planet.y), planet.radius, alpha=0.5, color='grey')
-        ax.add_patch(circle)
-        plt.text(planet.x, planet.y + planet_radius_text_offset, planet.name, fontsize=12, ha='center', va='center', color='black' if planet.name == 'moon' else 'white')
+    plot_planets(ax, planets, circle_color='grey', text_color=lambda planet: 'black' if planet.name == 'moon' else 'white')
         
     ax.set_xlim(xlim) 
     ax.set_ylim(ylim) 
         
-    # Spacecraft plot parameters 
-    direction_vector_length = 40
-    
-    for craft in spacecraft: 
-        
-        # print(f"Spacecraft {craft.name} is at altitude {craft.altitude} KM, orbiting {craft.orbiting_body.name}.")
-        # print(f"With global angle {craft.angle_global} degrees and pointing angle {craft.pointing_angle} degrees.")
-        # print(f"Orbiting body: {craft.orbiting_body}")
-        
-        global_x = craft.orbiting_body.x + (craft.altitude + craft.orbiting_body.radius) * np.cos(np.radians(craft.angle_global))
-        global_y = craft.orbiting_body.y + (craft.altitude + craft.orbiting_body.radius) * np.sin(np.radians(craft.angle_global))
-        
-        # Plot the spacecraft
-        plt.plot(global_x, global_y, 'go')
-        
-        # Plot the direction vector
-        direction_x = global_x + direction_vector_length * np.cos(craft.get_absolute_pointing_angle(degrees=False))
-        direction_y = global_y + direction_vector_length * np.sin(craft.get_absolute_pointing_angle(degrees=False))
-        ax.annotate("", xy=(direction_x, direction_y), xytext=(global_x, global_y), arrowprops=dict(arrowstyle="->"))
+    plot_spacecraft(ax, spacecraft, colors='g')
         
         
     # ax.set_aspect('equal', adjustable='datalim')
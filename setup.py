@@ -5,4 +5,5 @@ setup(
     version='0.1',
     packages=find_packages(),
     package_dir={'dinosim': 'dinosim'},
+    extras_require={'numba': ['numba'], 'numexpr': ['numexpr']},
 )
\ No newline at end of file